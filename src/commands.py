@@ -1,85 +1,91 @@
-from datetime import datetime, time, timedelta, timezone
+from datetime import timedelta
 
 import discord
 
-from . import db, reporter
+from . import reporter
 from .reporter import format_seconds
-from .tracker import utc_now
+from .tracker import local_day_key, local_time_and_day, midnight_utc_for_local_day, utc_now
 
+# Shared across replies so each response doesn't build its own mention policy.
+_NO_MENTIONS = discord.AllowedMentions.none()
 
-MANUAL_REPORT_META_KEY = "last_manual_report_at_utc"
+
+async def _reply_ephemeral(interaction, content):
+    """Send a private reply that never pings anyone."""
+    await interaction.response.send_message(content, ephemeral=True, allowed_mentions=_NO_MENTIONS)
 
 
 def register_commands(bot):
     """Register all slash commands on the bot. Called once during setup."""
-    guild_scope = discord.Object(id=bot.config["guild_id"])
+    # Config is fixed for the bot's lifetime, so resolve it once for all closures.
+    guild_id = bot.config.guild_id
+    tz = bot.config.timezone
+    tracked_voice_channel_id = bot.config.tracked_voice_channel_id
+    report_channel_id = bot.config.report_channel_id
+    guild_scope = discord.Object(id=guild_id)
+
+    # Everything in /status except the two timestamps is fixed, so format it once.
+    status_template = "\n".join([
+        "Voice tracker status: online",
+        f"Guild ID: `{guild_id}`",
+        f"Tracked voice channel ID: `{tracked_voice_channel_id}`",
+        f"Report channel ID: `{report_channel_id}`",
+        f"Timezone: `{tz.key}`",
+        "Current local time: `{now_local}`",
+        "Next scheduled midnight check: `{next_midnight}`",
+    ])
 
     @bot.tree.command(name="status", description="Show bot status", guild=guild_scope)
     async def status(interaction):
-        now = utc_now()
-        now_local = now.astimezone(bot.config["timezone"])
-        next_midnight_local = datetime.combine(now_local.date() + timedelta(days=1), time.min, tzinfo=bot.config["timezone"])
-
-        lines = [
-            "Voice tracker status: online",
-            f"Guild ID: `{bot.config['guild_id']}`",
-            f"Tracked voice channel ID: `{bot.config['tracked_voice_channel_id']}`",
-            f"Report channel ID: `{bot.config['report_channel_id']}`",
-            f"Timezone: `{bot.config['timezone'].key}`",
-            f"Current local time: `{now_local.isoformat()}`",
-            f"Next scheduled midnight check: `{next_midnight_local.isoformat()}`",
-        ]
-        await interaction.response.send_message("\n".join(lines), ephemeral=True)
+        now_local, _ = local_time_and_day(tz)
+        next_midnight_local = midnight_utc_for_local_day(now_local.date() + timedelta(days=1), tz).astimezone(tz)
+
+        content = status_template.format(
+            now_local=now_local.isoformat(),
+            next_midnight=next_midnight_local.isoformat(),
+        )
+        await _reply_ephemeral(interaction, content)
 
     @bot.tree.command(name="today", description="Show today's tracked totals so far", guild=guild_scope)
     async def today(interaction):
-        if interaction.guild is None or interaction.guild.id != bot.config["guild_id"]:
-            await interaction.response.send_message("This command can only be used in the configured server.", ephemeral=True)
+        if interaction.guild is None or interaction.guild.id != guild_id:
+            await _reply_ephemeral(interaction, "This command can only be used in the configured server.")
             return
 
         now = utc_now()
-        day_local = now.astimezone(bot.config["timezone"]).date().isoformat()
-        tz = bot.config["timezone"]
+        day_local = local_day_key(tz, now)
 
-        rows = reporter.build_rows_for_day(
+        rows = await reporter.fetch_rows_for_day(
             interaction.guild, day_local, tz, include_live=True, now_utc=now
         )
 
         if not rows:
-            await interaction.response.send_message(
-                f"No tracked activity for {day_local}.",
-                ephemeral=True,
-            )
+            await _reply_ephemeral(interaction, f"No tracked activity for {day_local}.")
             return
 
         lines = [f"Today's totals ({day_local}):"]
         lines.extend(f"- {row['display_name']}: `{format_seconds(row['seconds'])}`" for row in rows)
-        await interaction.response.send_message("\n".join(lines), ephemeral=True)
+        await _reply_ephemeral(interaction, "\n".join(lines))
 
     @bot.tree.command(name="report-now", description="Post a manual day-so-far report", guild=guild_scope)
     async def report_now(interaction):
-        if interaction.guild is None or interaction.guild.id != bot.config["guild_id"]:
-            await interaction.response.send_message("This command can only be used in the configured server.", ephemeral=True)
+        if interaction.guild is None or interaction.guild.id != guild_id:
+            await _reply_ephemeral(interaction, "This command can only be used in the configured server.")
             return
 
         now = utc_now()
-        tz = bot.config["timezone"]
 
         if bot.report_channel is None:
-            await interaction.response.send_message("Report channel is not available.", ephemeral=True)
+            await _reply_ephemeral(interaction, "Report channel is not available.")
             return
 
-        tracked_name = str(bot.config["tracked_voice_channel_id"])
-        if bot.tracked_voice_channel is not None:
-            tracked_name = bot.tracked_voice_channel.name
-
-        day_local = now.astimezone(tz).date().isoformat()
+        day_local = local_day_key(tz, now)
 
         try:
             await reporter.post_report(
                 interaction.guild,
                 bot.report_channel,
-                tracked_name,
+                bot.tracked_voice_channel_name,
                 day_local,
                 tz,
                 include_live=True,
@@ -87,10 +93,10 @@ def register_commands(bot):
             )
         except Exception as exc:
             bot.logger.exception("/report-now failed")
-            await interaction.response.send_message(f"Failed to send report: `{exc}`", ephemeral=True)
+            await _reply_ephemeral(interaction, f"Failed to send report: `{exc}`")
             return
 
-        await interaction.response.send_message(
-            f"Posted day-so-far report for `{day_local}` in <#{bot.config['report_channel_id']}>.",
-            ephemeral=True,
+        await _reply_ephemeral(
+            interaction,
+            f"Posted day-so-far report for `{day_local}` in <#{report_channel_id}>.",
         )
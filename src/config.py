@@ -1,13 +1,26 @@
 import os
+from dataclasses import dataclass, field
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 
+@dataclass(frozen=True, slots=True)
+class Config:
+    """Validated bot configuration. Immutable for the lifetime of the process."""
+
+    # Kept out of repr so the token never ends up in logs.
+    discord_token: str = field(repr=False)
+    guild_id: int
+    tracked_voice_channel_id: int
+    report_channel_id: int
+    timezone: ZoneInfo
+
+
 def _required_env(name):
-    """Read and trim a required environment variable."""
-    value = os.getenv(name)
+    """Read and trim a required environment variable. Blank values count as missing."""
+    value = (os.getenv(name) or "").strip()
     if not value:
         raise ValueError(f"Missing required environment variable: {name}")
-    return value.strip()
+    return value
 
 
 def _required_int_env(name):
@@ -33,16 +46,11 @@ def _timezone_from_env(name):
 
 
 def load_config():
-    """Load and validate all bot configuration from environment.
-
-    Returns a plain dict with keys:
-        discord_token, guild_id, tracked_voice_channel_id,
-        report_channel_id, timezone
-    """
-    return {
-        "discord_token": _required_env("DISCORD_TOKEN"),
-        "guild_id": _required_int_env("GUILD_ID"),
-        "tracked_voice_channel_id": _required_int_env("TRACKED_VOICE_CHANNEL_ID"),
-        "report_channel_id": _required_int_env("REPORT_CHANNEL_ID"),
-        "timezone": _timezone_from_env("TIMEZONE"),
-    }
+    """Load and validate all bot configuration from environment. Returns a Config."""
+    return Config(
+        discord_token=_required_env("DISCORD_TOKEN"),
+        guild_id=_required_int_env("GUILD_ID"),
+        tracked_voice_channel_id=_required_int_env("TRACKED_VOICE_CHANNEL_ID"),
+        report_channel_id=_required_int_env("REPORT_CHANNEL_ID"),
+        timezone=_timezone_from_env("TIMEZONE"),
+    )
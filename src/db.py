@@ -1,103 +1,369 @@
+import asyncio
+import functools
 import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timezone
 
 # Module-level connection — set by connect_db(), used by all other functions.
 _connection = None
+# Bound methods of _connection, so each query skips an attribute lookup on it.
+_execute = None
+_executemany = None
+
+# One worker thread runs all DB work for async callers, which keeps SQLite
+# access serialized and off the event loop.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="voice-tracker-db")
+
+# Recently read get_daily_totals() results: day_local -> (monotonic time, rows).
+# Entries are dropped on any write to that day, so the TTL only bounds staleness
+# from writers outside this process.
+_daily_totals_cache = {}
+DAILY_TOTALS_CACHE_TTL_SECONDS = 5.0
+
+# Last list_open_session_columns() result: "columns" -> (monotonic time, result).
+# Cleared on every open_sessions write; callers opt in to reusing it via max_age.
+_open_sessions_snapshot = {}
+
+# Statement cache size; comfortably above the number of distinct statements below.
+_CACHED_STATEMENTS = 128
+
+# Fixed SQL text, defined once so every call hits sqlite3's prepared-statement cache.
+_SQL_UPSERT_OPEN_SESSION = """
+    INSERT INTO open_sessions (user_id, started_at_epoch)
+    VALUES (?, ?)
+    ON CONFLICT(user_id)
+    DO UPDATE SET started_at_epoch=excluded.started_at_epoch
+"""
+_SQL_UPDATE_OPEN_SESSION_START = "UPDATE open_sessions SET started_at_epoch = ? WHERE user_id = ?"
+_SQL_SELECT_OPEN_SESSION = "SELECT user_id, started_at_epoch FROM open_sessions WHERE user_id = ?"
+_SQL_SELECT_OPEN_SESSIONS = "SELECT user_id, started_at_epoch FROM open_sessions"
+_SQL_SELECT_OPEN_SESSIONS_STARTED_BEFORE = (
+    "SELECT user_id, started_at_epoch FROM open_sessions WHERE started_at_epoch < ?"
+)
+_SQL_ROLLOVER_DAILY = """
+    INSERT INTO daily_totals (day_local, user_id, seconds)
+    SELECT ?, user_id, ? - started_at_epoch
+    FROM open_sessions
+    WHERE started_at_epoch >= ? AND started_at_epoch < ?
+    ON CONFLICT(day_local, user_id)
+    DO UPDATE SET seconds = seconds + excluded.seconds
+"""
+_SQL_ROLLOVER_OPEN_SESSIONS = """
+    UPDATE open_sessions SET started_at_epoch = ?
+    WHERE started_at_epoch >= ? AND started_at_epoch < ?
+"""
+_SQL_DELETE_OPEN_SESSION = "DELETE FROM open_sessions WHERE user_id = ?"
+_SQL_POP_OPEN_SESSION = "DELETE FROM open_sessions WHERE user_id = ? RETURNING user_id, started_at_epoch"
+_SQL_DELETE_OPEN_SESSIONS = "DELETE FROM open_sessions"
+_SQL_UPSERT_DAILY = """
+    INSERT INTO daily_totals (day_local, user_id, seconds)
+    VALUES (?, ?, ?)
+    ON CONFLICT(day_local, user_id)
+    DO UPDATE SET seconds = seconds + excluded.seconds
+"""
+_SQL_SELECT_DAILY = """
+    SELECT user_id, seconds
+    FROM daily_totals
+    WHERE day_local = ?
+    ORDER BY seconds DESC, user_id ASC
+"""
+_SQL_SELECT_META = "SELECT value FROM meta WHERE key = ?"
+_SQL_UPSERT_META = """
+    INSERT INTO meta (key, value)
+    VALUES (?, ?)
+    ON CONFLICT(key)
+    DO UPDATE SET value=excluded.value
+"""
+
+
+class OpenSession:
+    """One open_sessions row. The start is stored as UTC epoch seconds.
+
+    started_at_utc builds the datetime on first access, so callers that only
+    need the user or the raw epoch never pay for it.
+    """
+
+    __slots__ = ("user_id", "started_at_epoch", "_started_at_utc")
+
+    def __init__(self, user_id, started_at_epoch):
+        self.user_id = user_id
+        self.started_at_epoch = started_at_epoch
+        self._started_at_utc = None
+
+    @property
+    def started_at_utc(self):
+        if self._started_at_utc is None:
+            self._started_at_utc = datetime.fromtimestamp(self.started_at_epoch, timezone.utc)
+        return self._started_at_utc
 
 
 def connect_db(db_path):
-    """Open a SQLite connection and store it at module level."""
-    global _connection
-    _connection = sqlite3.connect(str(db_path))
+    """Open the process-wide SQLite connection in autocommit mode and store it at module level.
+
+    The connection is opened once and reused for every query until close_db().
+    It is not bound to the opening thread, so callers may hand DB work to a
+    worker thread as long as access stays serialized.
+    """
+    global _connection, _execute, _executemany
+    _connection = sqlite3.connect(
+        str(db_path),
+        isolation_level=None,
+        check_same_thread=False,
+        cached_statements=_CACHED_STATEMENTS,
+    )
     _connection.row_factory = sqlite3.Row
+    _daily_totals_cache.clear()
+    _open_sessions_snapshot.clear()
+    _execute = _connection.execute
+    _executemany = _connection.executemany
+    # WAL with synchronous=NORMAL turns each single-row write into a cheap log
+    # append instead of a journal rewrite plus fsync.
+    _execute("PRAGMA journal_mode=WAL")
+    _execute("PRAGMA synchronous=NORMAL")
+    _execute("PRAGMA temp_store=MEMORY")
+    # Read through a 64 MiB memory map with a ~20 MB page cache, and wait briefly on locks instead of failing.
+    _execute("PRAGMA mmap_size=67108864")
+    _execute("PRAGMA cache_size=-20000")
+    _execute("PRAGMA busy_timeout=5000")
 
 
 def close_db():
     """Close the module-level SQLite connection."""
-    global _connection
+    global _connection, _execute, _executemany
     if _connection is not None:
         _connection.close()
         _connection = None
+        _execute = None
+        _executemany = None
+    _daily_totals_cache.clear()
+    _open_sessions_snapshot.clear()
 
 
-def initialize_db():
-    """Create the tables if they don't exist yet."""
-    _connection.executescript(
-        """
-        CREATE TABLE IF NOT EXISTS open_sessions (
-          user_id TEXT PRIMARY KEY,
-          started_at_utc TEXT NOT NULL
-        );
-
-        CREATE TABLE IF NOT EXISTS daily_totals (
-          day_local TEXT NOT NULL,
-          user_id TEXT NOT NULL,
-          seconds INTEGER NOT NULL DEFAULT 0,
-          PRIMARY KEY (day_local, user_id)
-        );
-
-        CREATE TABLE IF NOT EXISTS meta (
-          key TEXT PRIMARY KEY,
-          value TEXT NOT NULL
-        );
-        """
+# Current schema, run statement by statement so it can share initialize_db's transaction
+# (executescript would commit on its own first).
+_SCHEMA_STATEMENTS = (
+    """
+    CREATE TABLE IF NOT EXISTS open_sessions (
+      user_id INTEGER PRIMARY KEY,
+      started_at_epoch INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS daily_totals (
+      day_local TEXT NOT NULL,
+      user_id INTEGER NOT NULL,
+      seconds INTEGER NOT NULL DEFAULT 0,
+      PRIMARY KEY (day_local, user_id)
     )
-    _connection.commit()
+    """,
+    # Matches get_daily_totals' ORDER BY so reports read the index without a sort step.
+    """
+    CREATE INDEX IF NOT EXISTS idx_daily_totals_day_seconds
+      ON daily_totals (day_local, seconds DESC, user_id)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS meta (
+      key TEXT PRIMARY KEY,
+      value TEXT NOT NULL
+    )
+    """,
+)
+
+
+def initialize_db():
+    """Create the tables if they don't exist yet, migrating older layouts.
+
+    Moving old tables aside, creating the current ones and copying the rows
+    over all happen in one transaction, so an interrupted migration leaves the
+    old layout untouched.
+    """
+    with transaction():
+        detached = _detach_legacy_tables()
+
+        for statement in _SCHEMA_STATEMENTS:
+            _execute(statement)
+
+        if detached:
+            _backfill_legacy_tables(detached)
+
+
+def _table_columns(table):
+    """Return {column_name: declared_type} for a table; empty if it doesn't exist."""
+    return {row["name"]: row["type"].upper() for row in _execute(f"PRAGMA table_info({table})")}
+
+
+def _detach_legacy_tables():
+    """Move tables with an older layout aside so initialize_db can recreate them.
+
+    Older layouts stored user IDs as TEXT and session starts as ISO TEXT.
+    Returns the set of table names that need backfilling.
+    """
+    detached = set()
+
+    sessions = _table_columns("open_sessions")
+    if "started_at_utc" in sessions or sessions.get("user_id") == "TEXT":
+        _execute("ALTER TABLE open_sessions RENAME TO open_sessions_legacy")
+        detached.add("open_sessions")
+
+    totals = _table_columns("daily_totals")
+    if totals.get("user_id") == "TEXT":
+        # The index would follow the renamed table and block recreating it by name.
+        _execute("DROP INDEX IF EXISTS idx_daily_totals_day_seconds")
+        _execute("ALTER TABLE daily_totals RENAME TO daily_totals_legacy")
+        detached.add("daily_totals")
+
+    return detached
+
+
+def _backfill_legacy_tables(detached):
+    """Copy legacy rows into the current tables, then drop the legacy copies."""
+    with transaction():
+        if "open_sessions" in detached:
+            sessions = []
+            for row in _execute("SELECT * FROM open_sessions_legacy").fetchall():
+                if "started_at_epoch" in row.keys():
+                    started = row["started_at_epoch"]
+                else:
+                    started = _to_epoch(datetime.fromisoformat(row["started_at_utc"]))
+                sessions.append((int(row["user_id"]), started))
+            _executemany(_SQL_UPSERT_OPEN_SESSION, sessions)
+            _execute("DROP TABLE open_sessions_legacy")
+
+        if "daily_totals" in detached:
+            _execute(
+                """
+                INSERT INTO daily_totals (day_local, user_id, seconds)
+                SELECT day_local, CAST(user_id AS INTEGER), seconds FROM daily_totals_legacy
+                """
+            )
+            _execute("DROP TABLE daily_totals_legacy")
+
+
+async def run(fn, *args, **kwargs):
+    """Run a blocking DB-backed callable on the DB worker thread and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+
+@contextmanager
+def transaction():
+    """Group several writes into a single transaction (and a single commit).
+
+    Nested use joins the outer transaction.
+    """
+    if _connection.in_transaction:
+        yield
+        return
+
+    _execute("BEGIN")
+    try:
+        yield
+    except BaseException:
+        _execute("ROLLBACK")
+        raise
+    _execute("COMMIT")
 
 
 def set_open_session(user_id, started_at_utc):
-    """Insert or update an open session for a user."""
-    started = _to_utc(started_at_utc).isoformat()
-    _connection.execute(
-        """
-        INSERT INTO open_sessions (user_id, started_at_utc)
-        VALUES (?, ?)
-        ON CONFLICT(user_id)
-        DO UPDATE SET started_at_utc=excluded.started_at_utc
-        """,
-        (user_id, started),
-    )
-    _connection.commit()
+    """Insert or update an open session for a user. The start is an aware datetime or UTC epoch seconds."""
+    _open_sessions_snapshot.clear()
+    _execute(_SQL_UPSERT_OPEN_SESSION, (user_id, _to_epoch(started_at_utc)))
+
+
+def set_open_sessions(user_ids, started_at_utc):
+    """Insert or update open sessions for many users, all starting at one instant, in one executemany."""
+    _open_sessions_snapshot.clear()
+    started = _to_epoch(started_at_utc)
+    _executemany(_SQL_UPSERT_OPEN_SESSION, [(user_id, started) for user_id in user_ids])
+
+
+def restart_open_sessions(user_ids, started_at_utc):
+    """Move the start of existing open sessions for many users to one instant, in one executemany."""
+    _open_sessions_snapshot.clear()
+    started = _to_epoch(started_at_utc)
+    _executemany(_SQL_UPDATE_OPEN_SESSION_START, [(started, user_id) for user_id in user_ids])
 
 
 def get_open_session(user_id):
-    """Get one open session by user_id. Returns a dict or None."""
-    row = _connection.execute(
-        "SELECT user_id, started_at_utc FROM open_sessions WHERE user_id = ?",
-        (user_id,),
-    ).fetchone()
+    """Get one open session by user_id. Returns an OpenSession or None."""
+    row = _execute(_SQL_SELECT_OPEN_SESSION, (user_id,)).fetchone()
     if row is None:
         return None
-    return {
-        "user_id": row["user_id"],
-        "started_at_utc": datetime.fromisoformat(row["started_at_utc"]),
-    }
+    return OpenSession(row["user_id"], row["started_at_epoch"])
 
 
 def delete_open_session(user_id):
     """Remove the open session for a user."""
-    _connection.execute("DELETE FROM open_sessions WHERE user_id = ?", (user_id,))
-    _connection.commit()
+    _open_sessions_snapshot.clear()
+    _execute(_SQL_DELETE_OPEN_SESSION, (user_id,))
+
+
+def pop_open_session(user_id):
+    """Remove and return the open session for a user in one statement. Returns an OpenSession or None."""
+    _open_sessions_snapshot.clear()
+    row = _execute(_SQL_POP_OPEN_SESSION, (user_id,)).fetchone()
+    if row is None:
+        return None
+    return OpenSession(row["user_id"], row["started_at_epoch"])
 
 
 def clear_open_sessions():
     """Remove all open sessions."""
-    _connection.execute("DELETE FROM open_sessions")
-    _connection.commit()
+    _open_sessions_snapshot.clear()
+    _execute(_SQL_DELETE_OPEN_SESSIONS)
+
 
+def list_open_session_columns(max_age=0.0):
+    """Return all open sessions as two parallel lists: (user_ids, started_at_epochs).
 
-def list_open_sessions():
-    """Return all open sessions as a list of dicts."""
-    rows = _connection.execute(
-        "SELECT user_id, started_at_utc FROM open_sessions"
-    ).fetchall()
-    return [
-        {
-            "user_id": row["user_id"],
-            "started_at_utc": datetime.fromisoformat(row["started_at_utc"]),
-        }
-        for row in rows
-    ]
+    Rows come back as plain tuples, so no OpenSession is built per row. With
+    max_age > 0, a snapshot read at most that many seconds ago is reused unless
+    open_sessions was written since; treat the returned lists as read-only.
+    """
+    now = time.monotonic()
+    cached = _open_sessions_snapshot.get("columns")
+    if cached is not None and now - cached[0] < max_age:
+        return cached[1]
+
+    cursor = _connection.cursor()
+    cursor.row_factory = None
+    rows = cursor.execute(_SQL_SELECT_OPEN_SESSIONS).fetchall()
+    if rows:
+        user_ids, started_at_epochs = zip(*rows)
+        result = (list(user_ids), list(started_at_epochs))
+    else:
+        result = ([], [])
+    # Uncommitted reads could be rolled back, so only keep snapshots taken outside a transaction.
+    if not _connection.in_transaction:
+        _open_sessions_snapshot["columns"] = (now, result)
+    return result
+
+
+def list_open_sessions_started_before(epoch):
+    """Return open sessions that started before `epoch` as parallel lists: (user_ids, started_at_epochs)."""
+    cursor = _connection.cursor()
+    cursor.row_factory = None
+    rows = cursor.execute(_SQL_SELECT_OPEN_SESSIONS_STARTED_BEFORE, (epoch,)).fetchall()
+    if not rows:
+        return [], []
+    user_ids, started_at_epochs = zip(*rows)
+    return list(user_ids), list(started_at_epochs)
+
+
+def close_open_sessions_within_day(day_local, day_start_epoch, day_end_epoch):
+    """Credit sessions that started within one local day up to its end, then restart them there.
+
+    Sessions with day_start_epoch <= start < day_end_epoch get (day_end_epoch - start)
+    seconds added to day_local and are moved to start at day_end_epoch. Runs as one
+    INSERT ... SELECT and one UPDATE inside a transaction.
+    """
+    _open_sessions_snapshot.clear()
+    _daily_totals_cache.pop(day_local, None)
+    with transaction():
+        _execute(_SQL_ROLLOVER_DAILY, (day_local, day_end_epoch, day_start_epoch, day_end_epoch))
+        _execute(_SQL_ROLLOVER_OPEN_SESSIONS, (day_end_epoch, day_start_epoch, day_end_epoch))
 
 
 def add_daily_seconds(day_local, user_id, seconds):
@@ -105,43 +371,49 @@ def add_daily_seconds(day_local, user_id, seconds):
     if seconds <= 0:
         return
 
-    _connection.execute(
-        """
-        INSERT INTO daily_totals (day_local, user_id, seconds)
-        VALUES (?, ?, ?)
-        ON CONFLICT(day_local, user_id)
-        DO UPDATE SET seconds = seconds + excluded.seconds
-        """,
-        (day_local, user_id, seconds),
-    )
-    _connection.commit()
+    _daily_totals_cache.pop(day_local, None)
+    _execute(_SQL_UPSERT_DAILY, (day_local, user_id, seconds))
+
+
+def add_daily_seconds_many(rows):
+    """Add many (day_local, user_id, seconds) increments in one transaction. Ignores zero/negative values."""
+    rows = [row for row in rows if row[2] > 0]
+    for row in rows:
+        _daily_totals_cache.pop(row[0], None)
+    with transaction():
+        _executemany(_SQL_UPSERT_DAILY, rows)
 
 
 def get_daily_totals(day_local):
-    """Return all daily totals for a given day as a list of dicts."""
-    rows = _connection.execute(
-        """
-        SELECT day_local, user_id, seconds
-        FROM daily_totals
-        WHERE day_local = ?
-        ORDER BY seconds DESC, user_id ASC
-        """,
-        (day_local,),
-    ).fetchall()
-
-    return [
-        {
-            "day_local": row["day_local"],
-            "user_id": row["user_id"],
-            "seconds": row["seconds"],
-        }
-        for row in rows
-    ]
+    """Return a day's totals as a list of (user_id, seconds) rows, most seconds first.
+
+    Rows are the sqlite3.Row objects themselves: they unpack as tuples and also
+    allow row["seconds"]. Results are cached briefly per day; treat the returned
+    list as read-only.
+    """
+    now = time.monotonic()
+    cached = _daily_totals_cache.get(day_local)
+    if cached is not None and now - cached[0] < DAILY_TOTALS_CACHE_TTL_SECONDS:
+        return cached[1]
+
+    totals = _execute(_SQL_SELECT_DAILY, (day_local,)).fetchall()
+    # Uncommitted reads could be rolled back, so only cache outside a transaction.
+    if not _connection.in_transaction:
+        _daily_totals_cache[day_local] = (now, totals)
+    return totals
+
+
+def get_daily_totals_map(day_local):
+    """Return a day's totals as a new {user_id: seconds} dict that callers may modify.
+
+    Built in C straight from the cached rows of get_daily_totals().
+    """
+    return dict(get_daily_totals(day_local))
 
 
 def get_meta(key):
     """Read a value from the meta key/value store. Returns a string or None."""
-    row = _connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    row = _execute(_SQL_SELECT_META, (key,)).fetchone()
     if row is None:
         return None
     return str(row["value"])
@@ -149,20 +421,16 @@ def get_meta(key):
 
 def set_meta(key, value):
     """Write a value to the meta key/value store."""
-    _connection.execute(
-        """
-        INSERT INTO meta (key, value)
-        VALUES (?, ?)
-        ON CONFLICT(key)
-        DO UPDATE SET value=excluded.value
-        """,
-        (key, value),
-    )
-    _connection.commit()
+    _execute(_SQL_UPSERT_META, (key, value))
+
 
+def _to_epoch(value):
+    """Convert a timezone-aware datetime to whole UTC epoch seconds for storage.
 
-def _to_utc(value):
-    """Normalize a timezone-aware datetime to UTC for storage."""
+    Integers are taken as epoch seconds already and passed through unchanged.
+    """
+    if isinstance(value, int):
+        return value
     if value.tzinfo is None:
         raise ValueError("Datetime must be timezone-aware")
-    return value.astimezone(timezone.utc)
+    return int(value.timestamp())
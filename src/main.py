@@ -1,9 +1,10 @@
+import asyncio
 import logging
-from datetime import datetime, time, timedelta, timezone
+from datetime import timedelta
 from pathlib import Path
 
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 from dotenv import load_dotenv
 
 from . import db, reporter, tracker
@@ -12,8 +13,9 @@ from .config import load_config
 from .tracker import utc_now
 
 AUTO_REPORT_META_KEY = "last_auto_report_day"
-MANUAL_REPORT_META_KEY = "last_manual_report_at_utc"
 DEFAULT_DB_PATH = Path("voice_tracker.db")
+# Longest single sleep before the midnight task re-reads the wall clock.
+MAX_MIDNIGHT_SLEEP_SECONDS = 3600
 
 
 def create_bot(config):
@@ -26,7 +28,12 @@ def create_bot(config):
     intents.guilds = True
     intents.voice_states = True
 
-    bot = commands.Bot(command_prefix="!", intents=intents)
+    # Without the members intent, voice is the only thing keeping members cached;
+    # reseeding and report display names both rely on it.
+    member_cache_flags = discord.MemberCacheFlags.none()
+    member_cache_flags.voice = True
+
+    bot = commands.Bot(command_prefix="!", intents=intents, member_cache_flags=member_cache_flags)
 
     # Attach config and runtime state directly on the bot object.
     bot.config = config
@@ -34,7 +41,12 @@ def create_bot(config):
     bot.runtime_ready = False
     bot.guild_obj = None
     bot.tracked_voice_channel = None
+    # Display name for reports; falls back to the raw ID until the channel resolves.
+    bot.tracked_voice_channel_name = str(config.tracked_voice_channel_id)
     bot.report_channel = None
+    # In-memory copy of AUTO_REPORT_META_KEY so the report loop skips a DB read per tick.
+    bot.last_auto_report_day = None
+    bot.midnight_report_task = None
 
     # --- Event Handlers ---
 
@@ -42,8 +54,9 @@ def create_bot(config):
     async def setup_hook():
         """Called automatically by discord.py during startup."""
         register_commands(bot)
-        await bot.tree.sync(guild=discord.Object(id=config["guild_id"]))
-        midnight_report_loop.start()
+        bot.last_auto_report_day = await db.run(db.get_meta, AUTO_REPORT_META_KEY)
+        await bot.tree.sync(guild=discord.Object(id=config.guild_id))
+        bot.midnight_report_task = asyncio.create_task(midnight_report_runner())
 
     @bot.event
     async def on_ready():
@@ -55,67 +68,64 @@ def create_bot(config):
             bot.runtime_ready = True
             bot.logger.info("Runtime checks passed")
 
+    # Read on every voice event in every guild the bot can see, so resolve once.
+    tracked_channel_id = config.tracked_voice_channel_id
+    guild_id = config.guild_id
+    tz = config.timezone
+
     @bot.event
     async def on_voice_state_update(member, before, after):
+        before_id = before.channel.id if before.channel else None
+        after_id = after.channel.id if after.channel else None
+        # Most events never touch the tracked channel; channel IDs are globally
+        # unique, so this one check filters them before anything else runs.
+        if before_id != tracked_channel_id and after_id != tracked_channel_id:
+            return
+
         if not bot.runtime_ready:
             return
         if member.bot:
             return
-        if member.guild.id != config["guild_id"]:
+        if member.guild.id != guild_id:
             return
 
-        tracked_channel_id = config["tracked_voice_channel_id"]
-        before_id = before.channel.id if before.channel else None
-        after_id = after.channel.id if after.channel else None
-
         now = utc_now()
-        user_id = str(member.id)
-        tz = config["timezone"]
+        user_id = member.id
 
         # Enter tracked channel => open a session.
         if before_id != tracked_channel_id and after_id == tracked_channel_id:
-            if tracker.start_session(user_id, tz, started_at_utc=now):
+            if await db.run(tracker.start_session, user_id, tz, started_at_utc=now):
                 bot.logger.info("Session started: user=%s", user_id)
             return
 
         # Leave tracked channel => close and persist the session.
         if before_id == tracked_channel_id and after_id != tracked_channel_id:
-            tracked_seconds = tracker.end_session(user_id, tz, ended_at_utc=now)
+            tracked_seconds = await db.run(tracker.end_session, user_id, tz, ended_at_utc=now)
             bot.logger.info("Session ended: user=%s tracked=%ss", user_id, tracked_seconds)
 
-    # --- Midnight Report Loop ---
-
-    @tasks.loop(seconds=30)
-    async def midnight_report_loop():
-        if not bot.runtime_ready:
-            return
+    @bot.event
+    async def on_guild_channel_update(before, after):
+        if after.id == tracked_channel_id:
+            bot.tracked_voice_channel = after
+            bot.tracked_voice_channel_name = after.name
 
-        now = utc_now()
-        tz = config["timezone"]
-        now_local = now.astimezone(tz)
+    # --- Midnight Report Task ---
 
-        # Only execute report logic during 00:00 local minute.
-        if now_local.hour != 0 or now_local.minute != 0:
+    async def post_midnight_report(target_day, midnight_utc):
+        """Roll over open sessions at midnight and post the report for the day that just ended."""
+        if not bot.runtime_ready:
             return
 
-        target_day = (now_local.date() - timedelta(days=1)).isoformat()
-        # Guard against duplicate posts during the same 00:00 minute window.
-        if db.get_meta(AUTO_REPORT_META_KEY) == target_day:
+        # Guard against posting the same day twice (e.g. after a wall-clock jump).
+        if bot.last_auto_report_day == target_day:
             return
 
         if bot.guild_obj is None or bot.report_channel is None:
             bot.logger.error("Runtime resources unavailable while trying to post midnight report")
             return
 
-        midnight_local = datetime.combine(now_local.date(), time.min, tzinfo=tz)
-        midnight_utc = midnight_local.astimezone(timezone.utc)
-
         # Close yesterday's slice for users still connected at midnight.
-        tracker.rollover_open_sessions(midnight_utc, tz)
-
-        tracked_name = str(config["tracked_voice_channel_id"])
-        if bot.tracked_voice_channel is not None:
-            tracked_name = bot.tracked_voice_channel.name
+        await db.run(tracker.rollover_open_sessions, midnight_utc, tz)
 
         bot.logger.info("Posting midnight report for %s", target_day)
 
@@ -123,7 +133,7 @@ def create_bot(config):
             await reporter.post_report(
                 bot.guild_obj,
                 bot.report_channel,
-                tracked_name,
+                bot.tracked_voice_channel_name,
                 target_day,
                 tz,
                 include_live=False,
@@ -133,22 +143,37 @@ def create_bot(config):
             bot.logger.exception("Failed to post midnight report")
             return
 
-        db.set_meta(AUTO_REPORT_META_KEY, target_day)
+        await db.run(db.set_meta, AUTO_REPORT_META_KEY, target_day)
+        bot.last_auto_report_day = target_day
 
-    @midnight_report_loop.before_loop
-    async def before_midnight_report_loop():
+    async def midnight_report_runner():
+        """Sleep until each local midnight and post the report, instead of polling the clock."""
         await bot.wait_until_ready()
 
-    # Store the loop on the bot so we can cancel it on close.
-    bot._midnight_loop = midnight_report_loop
+        next_day = utc_now().astimezone(tz).date() + timedelta(days=1)
+        while True:
+            midnight_utc = tracker.midnight_utc_for_local_day(next_day, tz)
+            # Sleep in bounded chunks and re-check the wall clock, so clock adjustments
+            # or an early wakeup can never fire the report before midnight.
+            while (delay := (midnight_utc - utc_now()).total_seconds()) > 0:
+                await asyncio.sleep(min(delay, MAX_MIDNIGHT_SLEEP_SECONDS))
+
+            try:
+                await post_midnight_report((next_day - timedelta(days=1)).isoformat(), midnight_utc)
+            except Exception:
+                bot.logger.exception("Midnight rollover failed")
+            # Normally just the following day; skips ahead if the process was suspended past several midnights.
+            next_day = max(next_day, utc_now().astimezone(tz).date()) + timedelta(days=1)
 
     # Override close to clean up resources.
     original_close = bot.close
 
     async def custom_close():
-        if midnight_report_loop.is_running():
-            midnight_report_loop.cancel()
-        db.close_db()
+        task = bot.midnight_report_task
+        if task is not None and not task.done():
+            task.cancel()
+        # Queued behind any in-flight DB work on the worker thread.
+        await db.run(db.close_db)
         await original_close()
 
     bot.close = custom_close
@@ -158,21 +183,21 @@ def create_bot(config):
 
 async def validate_runtime(bot, config):
     """Verify guild, channels, and permissions are set up correctly."""
-    guild = bot.get_guild(config["guild_id"])
+    guild = bot.get_guild(config.guild_id)
     if guild is None:
-        bot.logger.error("Configured guild %s not found", config["guild_id"])
+        bot.logger.error("Configured guild %s not found", config.guild_id)
         await bot.close()
         return False
 
-    tracked = guild.get_channel(config["tracked_voice_channel_id"])
+    tracked = guild.get_channel(config.tracked_voice_channel_id)
     if not isinstance(tracked, discord.VoiceChannel):
-        bot.logger.error("Tracked channel %s is missing or not a voice channel", config["tracked_voice_channel_id"])
+        bot.logger.error("Tracked channel %s is missing or not a voice channel", config.tracked_voice_channel_id)
         await bot.close()
         return False
 
-    report = guild.get_channel(config["report_channel_id"])
+    report = guild.get_channel(config.report_channel_id)
     if not isinstance(report, discord.TextChannel):
-        bot.logger.error("Report channel %s is missing or not a text channel", config["report_channel_id"])
+        bot.logger.error("Report channel %s is missing or not a text channel", config.report_channel_id)
         await bot.close()
         return False
 
@@ -193,21 +218,29 @@ async def validate_runtime(bot, config):
 
     bot.guild_obj = guild
     bot.tracked_voice_channel = tracked
+    bot.tracked_voice_channel_name = tracked.name
     bot.report_channel = report
 
-    reseed_from_channel(bot, config)
+    await reseed_from_channel(bot, config)
     return True
 
 
-def reseed_from_channel(bot, config):
+async def reseed_from_channel(bot, config):
     """Reset open sessions based on who's currently in the tracked voice channel."""
     if bot.tracked_voice_channel is None:
         return
 
     now = utc_now()
-    # Ignore bot accounts so only human members appear in tracked totals.
-    active_users = [str(member.id) for member in bot.tracked_voice_channel.members if not member.bot]
-    tracker.reseed_sessions(active_users, started_at_utc=now)
+    channel = bot.tracked_voice_channel
+    # voice_states comes straight from the gateway's voice state list, so it is
+    # complete even when the member cache is not. Ignore bot accounts so only
+    # human members appear in tracked totals; unresolved IDs are kept.
+    active_users = []
+    for user_id in channel.voice_states:
+        member = channel.guild.get_member(user_id)
+        if member is None or not member.bot:
+            active_users.append(user_id)
+    await db.run(tracker.reseed_sessions, active_users, started_at_utc=now)
     bot.logger.info("Reseeded open sessions for %d active users", len(active_users))
 
 
@@ -229,7 +262,7 @@ def main():
     db.initialize_db()
 
     bot = create_bot(config)
-    bot.run(config["discord_token"])
+    bot.run(config.discord_token)
 
 
 if __name__ == "__main__":
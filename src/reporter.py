@@ -1,41 +1,76 @@
+import functools
+import time
 from datetime import datetime
 
-from . import tracker
+from . import db, tracker
 
 try:
     import discord
 except ModuleNotFoundError:  # allows tests without discord.py installed
     discord = None
 
+# Never ping users in automated summaries; built once and reused for every post.
+_NO_MENTIONS = discord.AllowedMentions.none() if discord is not None else None
+
+# Recently resolved display names: user_id -> (monotonic time, name). The bot
+# serves one guild and has no member-update events, so entries simply expire.
+_display_name_cache = {}
+DISPLAY_NAME_CACHE_TTL_SECONDS = 60.0
+
 
 def format_seconds(total_seconds):
     """Render a duration as HH:MM:SS for consistent report output."""
-    safe_seconds = max(0, int(total_seconds))
+    return _format_whole_seconds(max(0, int(total_seconds)))
+
+
+@functools.lru_cache(maxsize=4096)
+def _format_whole_seconds(safe_seconds):
+    """format_seconds() for a non-negative int. Memoized: report durations repeat a lot."""
     hours, remainder = divmod(safe_seconds, 3600)
     minutes, seconds = divmod(remainder, 60)
     return f"{hours:02}:{minutes:02}:{seconds:02}"
 
 
-def build_rows_for_day(guild, day_local, tz, include_live=False, now_utc=None):
+async def fetch_rows_for_day(guild, day_local, tz, include_live=False, now_utc=None):
     """Build a sorted list of report row dicts for a given day.
 
     Each row is a dict with keys: user_id, display_name, seconds.
     Sorted by most seconds first, then by name alphabetically.
+    The totals query runs on the DB worker thread.
     """
-    totals = tracker.get_totals_for_day(day_local, tz, include_live=include_live, now_utc=now_utc)
+    totals = await db.run(tracker.get_totals_for_day, day_local, tz, include_live=include_live, now_utc=now_utc)
+    return build_rows_from_totals(guild, totals)
+
 
-    rows = []
+def build_rows_from_totals(guild, totals):
+    """Turn a {user_id: seconds} mapping into sorted report row dicts."""
+    # Sort plain tuples with the sort key up front, so no key function runs
+    # per element and names are case-folded exactly once.
+    items = []
+    now = time.monotonic()
     for user_id, seconds in totals.items():
         if seconds <= 0:
             continue
 
-        member = guild.get_member(int(user_id))
-        # Fall back to the raw ID when a member is no longer in the guild cache.
-        display_name = member.display_name if member else f"User {user_id}"
-        rows.append({"user_id": user_id, "display_name": display_name, "seconds": seconds})
-
-    rows.sort(key=lambda item: (-item["seconds"], item["display_name"].lower()))
-    return rows
+        cached = _display_name_cache.get(user_id)
+        if cached is not None and now - cached[0] < DISPLAY_NAME_CACHE_TTL_SECONDS:
+            display_name = cached[1]
+        else:
+            member = guild.get_member(user_id)
+            if member is not None:
+                display_name = member.display_name
+                _display_name_cache[user_id] = (now, display_name)
+            else:
+                # Fall back to the raw ID when a member is no longer in the guild
+                # cache; not cached, so the real name shows once they reappear.
+                display_name = f"User {user_id}"
+        items.append((-seconds, display_name.casefold(), user_id, display_name))
+
+    items.sort()
+    return [
+        {"user_id": user_id, "display_name": display_name, "seconds": -neg_seconds}
+        for neg_seconds, _, user_id, display_name in items
+    ]
 
 
 def build_report_content(day_local, tracked_channel_name, rows):
@@ -54,13 +89,12 @@ def build_report_content(day_local, tracked_channel_name, rows):
 async def post_report(guild, report_channel, tracked_channel_name, day_local, tz,
                       include_live=False, now_utc=None):
     """Build a report and send it to the report channel. Returns True on success."""
-    rows = build_rows_for_day(guild, day_local, tz, include_live=include_live, now_utc=now_utc)
+    rows = await fetch_rows_for_day(guild, day_local, tz, include_live=include_live, now_utc=now_utc)
     content = build_report_content(day_local, tracked_channel_name, rows)
 
     kwargs = {}
-    if discord is not None:
-        # Never ping users in automated summaries.
-        kwargs["allowed_mentions"] = discord.AllowedMentions.none()
+    if _NO_MENTIONS is not None:
+        kwargs["allowed_mentions"] = _NO_MENTIONS
 
     await report_channel.send(content, **kwargs)
     return True
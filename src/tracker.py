@@ -1,15 +1,30 @@
+import bisect
+import functools
 import logging
-from datetime import date, datetime, time, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
 
 from . import db
 
 
 logger = logging.getLogger(__name__)
 
+_SECONDS_PER_DAY = 86400
+# Bound once so hot paths skip the module attribute lookups and timedelta construction.
+_UTC = timezone.utc
+_ONE_DAY = timedelta(days=1)
+# Local day numbers below count days since 1970-01-01; this maps them to date ordinals.
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# IANA names that are fixed offsets by definition, besides every Etc/ zone.
+_FIXED_OFFSET_ZONE_KEYS = frozenset({"UTC", "UCT", "GMT", "GMT0", "GMT+0", "GMT-0", "Greenwich", "Universal", "Zulu"})
+# Latest local day seen per tz: tz -> (day_start_ts, day_end_ts, day_iso, previous_day_iso).
+_day_keys_cache = {}
+# Live totals may reuse an open-session read this recent; any session write invalidates it.
+OPEN_SESSIONS_SNAPSHOT_MAX_AGE_SECONDS = 0.25
+
 
 def utc_now():
     """Return the current time in UTC."""
-    return datetime.now(timezone.utc)
+    return datetime.now(_UTC)
 
 
 def split_interval_by_local_day(start_utc, end_utc, tz):
@@ -17,84 +32,256 @@ def split_interval_by_local_day(start_utc, end_utc, tz):
 
     Returns a list of tuples like [("2026-01-01", 600), ("2026-01-02", 600)].
     """
-    if start_utc.tzinfo is None or end_utc.tzinfo is None:
-        raise ValueError("start_utc and end_utc must be timezone-aware")
-
-    start = start_utc.astimezone(timezone.utc)
-    end = end_utc.astimezone(timezone.utc)
+    # Callers almost always pass UTC already, which is aware by definition, so the
+    # awareness check and the conversion only run for other inputs.
+    start = start_utc
+    end = end_utc
+    if start.tzinfo is not _UTC or end.tzinfo is not _UTC:
+        if start.tzinfo is None or end.tzinfo is None:
+            raise ValueError("start_utc and end_utc must be timezone-aware")
+        start = start.astimezone(_UTC)
+        end = end.astimezone(_UTC)
 
     if end <= start:
         return []
 
+    fixed_offset_s = _fixed_offset_seconds(tz)
+    if fixed_offset_s is not None:
+        return _split_fixed_offset(start.timestamp(), end.timestamp(), fixed_offset_s)
+
+    start_ts = start.timestamp()
+    end_ts = end.timestamp()
+
+    # Fast path for the usual session: it ends before the local midnight after
+    # its start, so there is nothing to split. The day bounds are cached per tz,
+    # so sessions from the current day need no zone conversion at all.
+    _, day_end_ts, day_iso, _ = _day_keys_at(tz, start_ts)
+    if end_ts <= day_end_ts:
+        seconds = int(end_ts - start_ts)
+        return [(day_iso, seconds)] if seconds > 0 else []
+
+    offset = start.astimezone(tz).utcoffset()
+
+    # Work on POSIX seconds from here on; the local offset is re-checked only at
+    # each local midnight, where a DST change could apply.
+    offset_s = int(offset.total_seconds())
+    local_day = int((start_ts + offset_s) // _SECONDS_PER_DAY)
+
     segments = []
-    cursor = start
+    cursor = start_ts
+
+    while cursor < end_ts:
+        next_midnight_ts, offset_s = _local_midnight_ts(local_day + 1, offset_s, tz)
+
+        chunk_end = min(end_ts, next_midnight_ts)
+        chunk_seconds = int(chunk_end - cursor)
+
+        if chunk_seconds > 0:
+            segments.append((_day_iso(local_day), chunk_seconds))
+
+        cursor = chunk_end
+        local_day += 1
+
+    return segments
+
+
+@functools.lru_cache(maxsize=512)
+def _day_iso(local_day):
+    """Return the ISO date key for a local day number (days since 1970-01-01). Memoized."""
+    return date.fromordinal(local_day + _EPOCH_ORDINAL).isoformat()
+
 
-    while cursor < end:
-        # Convert the cursor into local time so midnight boundaries match the configured timezone.
-        local_cursor = cursor.astimezone(tz)
-        local_day = local_cursor.date()
-        next_midnight_local = datetime.combine(local_day + timedelta(days=1), time.min, tzinfo=tz)
-        next_midnight_utc = next_midnight_local.astimezone(timezone.utc)
+@functools.lru_cache(maxsize=8)
+def _fixed_offset_seconds(tz):
+    """Return the UTC offset of `tz` in whole seconds if it never changes, else None."""
+    if isinstance(tz, timezone):
+        return int(tz.utcoffset(None).total_seconds())
+    key = getattr(tz, "key", None)
+    if key is not None and (key in _FIXED_OFFSET_ZONE_KEYS or key.startswith("Etc/")):
+        return int(tz.utcoffset(datetime(2000, 1, 1)).total_seconds())
+    return None
 
-        chunk_end = min(end, next_midnight_utc)
-        chunk_seconds = int((chunk_end - cursor).total_seconds())
+
+def _split_fixed_offset(start_ts, end_ts, offset_s):
+    """split_interval_by_local_day for a zone without transitions: every local day is 86400s long."""
+    local_day = int((start_ts + offset_s) // _SECONDS_PER_DAY)
+    segments = []
+    cursor = start_ts
+
+    while cursor < end_ts:
+        chunk_end = min(end_ts, (local_day + 1) * _SECONDS_PER_DAY - offset_s)
+        chunk_seconds = int(chunk_end - cursor)
 
         if chunk_seconds > 0:
-            segments.append((local_day.isoformat(), chunk_seconds))
+            segments.append((_day_iso(local_day), chunk_seconds))
 
         cursor = chunk_end
+        local_day += 1
 
     return segments
 
 
+def _utc_offset_seconds(ts, tz):
+    """Return the UTC offset of `tz` at POSIX time `ts`, in whole seconds."""
+    return int(datetime.fromtimestamp(ts, tz).utcoffset().total_seconds())
+
+
+def _local_midnight_ts(local_day, offset_s, tz):
+    """Return (POSIX time where local day number `local_day` begins, offset from then on).
+
+    `offset_s` is the offset in effect before that midnight. Without a DST change
+    this costs one offset lookup; the offset is only recomputed when it moved.
+    """
+    naive_midnight = local_day * _SECONDS_PER_DAY
+    candidate = naive_midnight - offset_s
+    actual = _utc_offset_seconds(candidate, tz)
+    if actual == offset_s:
+        return candidate, offset_s
+
+    retry = naive_midnight - actual
+    if _utc_offset_seconds(retry, tz) == actual:
+        return retry, actual
+    # Midnight falls inside a DST gap, so the day starts at the transition itself.
+    return candidate, actual
+
+
+def split_intervals_by_local_day(start_epochs, end_utc, tz):
+    """Split many intervals that share one end into (local_day_iso, seconds) buckets.
+
+    Gives the same buckets as split_interval_by_local_day() per start, but the
+    local midnights between the earliest start and the end are resolved once and
+    each start is placed among them with a bisect. `start_epochs` are POSIX
+    seconds. Returns one bucket list per start, in input order.
+    """
+    end_ts = end_utc.timestamp()
+    live_starts = [start_ts for start_ts in start_epochs if start_ts < end_ts]
+    if not live_starts:
+        return [[] for _ in start_epochs]
+
+    earliest = min(live_starts)
+    offset_s = _utc_offset_seconds(earliest, tz)
+    first_day = int((earliest + offset_s) // _SECONDS_PER_DAY)
+
+    # next_midnights[k] is where local day first_day + k ends; the last one
+    # reaches or passes end_ts.
+    next_midnights = []
+    day_lengths = []
+    previous_ts = None
+    local_day = first_day
+    while previous_ts is None or previous_ts < end_ts:
+        next_ts, offset_s = _local_midnight_ts(local_day + 1, offset_s, tz)
+        if previous_ts is not None:
+            day_lengths.append(next_ts - previous_ts)
+        next_midnights.append(next_ts)
+        previous_ts = next_ts
+        local_day += 1
+    day_keys = [_day_iso(first_day + k) for k in range(len(next_midnights))]
+    last = len(next_midnights) - 1
+
+    results = []
+    for start_ts in start_epochs:
+        if start_ts >= end_ts:
+            results.append([])
+            continue
+
+        k = bisect.bisect_right(next_midnights, start_ts)
+        if k == last:
+            seconds = int(end_ts - start_ts)
+            results.append([(day_keys[k], seconds)] if seconds > 0 else [])
+            continue
+
+        segments = []
+        seconds = int(next_midnights[k] - start_ts)
+        if seconds > 0:
+            segments.append((day_keys[k], seconds))
+        for j in range(k + 1, last):
+            segments.append((day_keys[j], day_lengths[j - 1]))
+        seconds = int(end_ts - next_midnights[last - 1])
+        if seconds > 0:
+            segments.append((day_keys[last], seconds))
+        results.append(segments)
+
+    return results
+
+
 def start_session(user_id, tz, started_at_utc=None):
     """Open a tracking session for a user. Returns True if started, False if already active."""
     if db.get_open_session(user_id) is not None:
         logger.debug("Ignoring duplicate start for user %s", user_id)
         return False
 
-    started = started_at_utc or utc_now()
+    started = started_at_utc if started_at_utc is not None else utc_now()
     db.set_open_session(user_id, started)
     return True
 
 
 def end_session(user_id, tz, ended_at_utc=None):
     """Close a tracking session and persist the tracked seconds. Returns total seconds tracked."""
-    session = db.get_open_session(user_id)
-    if session is None:
-        logger.debug("Ignoring stop for missing session user=%s", user_id)
-        return 0
+    ended = ended_at_utc if ended_at_utc is not None else utc_now()
+
+    # Popping inside the transaction means a failed write (or the naive-time
+    # error below) puts the session back.
+    with db.transaction():
+        session = db.pop_open_session(user_id)
+        if session is None:
+            logger.debug("Ignoring stop for missing session user=%s", user_id)
+            return 0
+
+        if ended.tzinfo is None:
+            raise ValueError("ended_at_utc must be timezone-aware")
+        ended_ts = ended.timestamp()
+
+        # Most sessions end on the local day they started: one upsert, no split.
+        _, day_end_ts, day_local, _ = _day_keys_at(tz, session.started_at_epoch)
+        if ended_ts <= day_end_ts:
+            seconds = int(ended_ts - session.started_at_epoch)
+            if seconds <= 0:
+                return 0
+            db.add_daily_seconds(day_local, user_id, seconds)
+            return seconds
 
-    ended = ended_at_utc or utc_now()
-    tracked = accumulate_interval(user_id, session["started_at_utc"], ended, tz)
-    db.delete_open_session(user_id)
-    return tracked
+        return accumulate_interval(user_id, session.started_at_utc, ended, tz)
 
 
 def accumulate_interval(user_id, start_utc, end_utc, tz):
-    """Split an interval across local days and persist each chunk. Returns total seconds."""
-    total_seconds = 0
-    for day_key, seconds in split_interval_by_local_day(start_utc, end_utc, tz):
-        db.add_daily_seconds(day_key, user_id, seconds)
-        total_seconds += seconds
-    return total_seconds
+    """Split an interval across local days and persist all chunks in one write. Returns total seconds."""
+    rows = [(day_key, user_id, seconds) for day_key, seconds in split_interval_by_local_day(start_utc, end_utc, tz)]
+    db.add_daily_seconds_many(rows)
+    return sum(row[2] for row in rows)
 
 
 def rollover_open_sessions(midnight_utc, tz):
     """At local midnight, close yesterday's portion and reopen at exactly midnight."""
-    for session in db.list_open_sessions():
-        if session["started_at_utc"] >= midnight_utc:
-            continue
-        accumulate_interval(session["user_id"], session["started_at_utc"], midnight_utc, tz)
-        db.set_open_session(session["user_id"], midnight_utc)
+    midnight_epoch = int(midnight_utc.timestamp())
+    day_start_ts, day_end_ts, day_local, _ = _day_keys_at(tz, midnight_epoch - 1)
+    # Sessions that started yesterday owe exactly (midnight - start) to yesterday,
+    # so SQLite can credit and restart them in place. Only when the given instant
+    # really is yesterday's closing midnight; otherwise everything takes the Python path.
+    within_day_since = int(day_start_ts) if day_end_ts == midnight_epoch else midnight_epoch
+
+    # One transaction for the whole flush instead of one write per user and day.
+    with db.transaction():
+        db.close_open_sessions_within_day(day_local, within_day_since, midnight_epoch)
+
+        # Older sessions cross at least one more midnight and need a real split.
+        user_ids, started_at_epochs = db.list_open_sessions_started_before(within_day_since)
+        if not user_ids:
+            return
+        daily_rows = []
+        segments_per_session = split_intervals_by_local_day(started_at_epochs, midnight_utc, tz)
+        for user_id, segments in zip(user_ids, segments_per_session):
+            for day_key, seconds in segments:
+                daily_rows.append((day_key, user_id, seconds))
+        db.add_daily_seconds_many(daily_rows)
+        db.restart_open_sessions(user_ids, midnight_epoch)
 
 
 def reseed_sessions(user_ids, started_at_utc=None):
     """On startup, reset open sessions to 'now' to avoid counting downtime."""
-    started = started_at_utc or utc_now()
-    db.clear_open_sessions()
-    for user_id in user_ids:
-        db.set_open_session(user_id, started)
+    started = started_at_utc if started_at_utc is not None else utc_now()
+    with db.transaction():
+        db.clear_open_sessions()
+        db.set_open_sessions(user_ids, started)
 
 
 def get_totals_for_day(day_local, tz, include_live=False, now_utc=None):
@@ -102,35 +289,86 @@ def get_totals_for_day(day_local, tz, include_live=False, now_utc=None):
 
     If include_live is True, adds in-progress session time on top of persisted totals.
     """
-    totals = {item["user_id"]: item["seconds"] for item in db.get_daily_totals(day_local)}
+    totals = db.get_daily_totals_map(day_local)
 
     if not include_live:
         return totals
 
-    now = now_utc or utc_now()
-    for session in db.list_open_sessions():
-        for segment_day, seconds in split_interval_by_local_day(session["started_at_utc"], now, tz):
-            if segment_day != day_local:
-                continue
-            totals[session["user_id"]] = totals.get(session["user_id"], 0) + seconds
+    now = now_utc if now_utc is not None else utc_now()
+    # Clamp each session to the day's UTC bounds, resolved once, comparing raw
+    # epochs so no datetime is built or split per session.
+    day_value = date.fromisoformat(day_local)
+    day_start_ts = midnight_utc_for_local_day(day_value, tz).timestamp()
+    day_end_ts = midnight_utc_for_local_day(day_value + _ONE_DAY, tz).timestamp()
+    window_end_ts = min(now.timestamp(), day_end_ts)
+    user_ids, started_at_epochs = db.list_open_session_columns(max_age=OPEN_SESSIONS_SNAPSHOT_MAX_AGE_SECONDS)
+    for user_id, started_at_epoch in zip(user_ids, started_at_epochs):
+        seconds = int(window_end_ts - max(started_at_epoch, day_start_ts))
+        if seconds > 0:
+            totals[user_id] = totals.get(user_id, 0) + seconds
 
     return totals
 
 
+@functools.lru_cache(maxsize=4)
+def _local_time_for_second(epoch_second, tz):
+    """Resolve a whole UTC second to (local_datetime, local_day_iso). Memoized."""
+    local = datetime.fromtimestamp(epoch_second, tz)
+    return local, local.date().isoformat()
+
+
+def local_time_and_day(tz, dt_utc=None):
+    """Return (local_datetime, local_day_iso) in the given timezone, truncated to the second.
+
+    Repeated calls within the same second reuse one timezone conversion.
+    """
+    current = dt_utc if dt_utc is not None else utc_now()
+    return _local_time_for_second(int(current.timestamp()), tz)
+
+
 def local_day_key(tz, dt_utc=None):
     """Return today's date as an ISO string in the given timezone."""
-    current = dt_utc or utc_now()
-    return current.astimezone(tz).date().isoformat()
+    current = dt_utc if dt_utc is not None else utc_now()
+    return _day_keys_at(tz, current.timestamp())[2]
 
 
 def previous_local_day_key(tz, dt_utc=None):
     """Return yesterday's date as an ISO string in the given timezone."""
-    current = dt_utc or utc_now()
-    local_date = current.astimezone(tz).date() - timedelta(days=1)
-    return local_date.isoformat()
+    current = dt_utc if dt_utc is not None else utc_now()
+    return _day_keys_at(tz, current.timestamp())[3]
+
 
+def _day_keys_at(tz, ts):
+    """Return (day_start_ts, day_end_ts, day_iso, previous_day_iso) for the local day containing POSIX time ts.
 
+    Keeps the latest local day seen per tz and reuses it while the time stays
+    inside that day, so only one conversion happens per day. Earlier days (old
+    session starts, yesterday at rollover) are computed without being stored,
+    so they never evict the current day.
+    """
+    cached = _day_keys_cache.get(tz)
+    if cached is not None and cached[0] <= ts < cached[1]:
+        return cached
+
+    local_date = datetime.fromtimestamp(ts, tz).date()
+    local_day = local_date.toordinal() - _EPOCH_ORDINAL
+    keys = (
+        midnight_utc_for_local_day(local_date, tz).timestamp(),
+        midnight_utc_for_local_day(local_date + _ONE_DAY, tz).timestamp(),
+        _day_iso(local_day),
+        _day_iso(local_day - 1),
+    )
+    if cached is None or ts >= cached[1]:
+        _day_keys_cache[tz] = keys
+    return keys
+
+
+@functools.lru_cache(maxsize=512)
 def midnight_utc_for_local_day(day_value, tz):
-    """Convert a local date's midnight to a UTC datetime."""
-    midnight_local = datetime.combine(day_value, time.min, tzinfo=tz)
-    return midnight_local.astimezone(timezone.utc)
+    """Convert a local date's midnight to a UTC datetime.
+
+    Memoized per (day, tz). Sized for the day-key cache, split boundaries and
+    reports on past days, not just today, yesterday and tomorrow.
+    """
+    midnight_local = datetime(day_value.year, day_value.month, day_value.day, tzinfo=tz)
+    return midnight_local.astimezone(_UTC)
@@ -0,0 +1,169 @@
+from datetime import datetime, timezone
+
+from src import db
+
+
+def test_transaction_rolls_back_on_error():
+    db.connect_db(":memory:")
+    db.initialize_db()
+
+    try:
+        with db.transaction():
+            db.add_daily_seconds("2026-02-01", 1, 100)
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+
+    assert db.get_daily_totals("2026-02-01") == []
+
+    with db.transaction():
+        db.add_daily_seconds("2026-02-01", 1, 100)
+        with db.transaction():
+            db.add_daily_seconds("2026-02-01", 1, 50)
+
+    assert [row["seconds"] for row in db.get_daily_totals("2026-02-01")] == [150]
+
+    db.close_db()
+
+
+def test_initialize_migrates_legacy_text_layout():
+    db.connect_db(":memory:")
+    db._connection.execute(
+        "CREATE TABLE open_sessions (user_id TEXT PRIMARY KEY, started_at_utc TEXT NOT NULL)"
+    )
+    db._connection.execute(
+        "INSERT INTO open_sessions VALUES ('7', '2026-02-01T10:00:00+00:00')"
+    )
+    db._connection.execute(
+        "CREATE TABLE daily_totals (day_local TEXT NOT NULL, user_id TEXT NOT NULL, "
+        "seconds INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (day_local, user_id))"
+    )
+    db._connection.execute("CREATE INDEX idx_daily_totals_day_seconds ON daily_totals (day_local, seconds DESC, user_id)")
+    db._connection.execute("INSERT INTO daily_totals VALUES ('2026-02-01', '7', 42)")
+
+    db.initialize_db()
+
+    assert [tuple(row) for row in db.get_daily_totals("2026-02-01")] == [(7, 42)]
+    assert db._connection.execute("SELECT typeof(user_id) FROM daily_totals").fetchall()[0][0] == "integer"
+    assert db._connection.execute(
+        "SELECT name FROM sqlite_master WHERE name LIKE '%legacy%'"
+    ).fetchall() == []
+
+    session = db.get_open_session(7)
+    assert session.started_at_epoch == int(datetime(2026, 2, 1, 10, tzinfo=timezone.utc).timestamp())
+    assert session.started_at_utc == datetime(2026, 2, 1, 10, tzinfo=timezone.utc)
+
+    db.close_db()
+
+
+def test_interrupted_migration_leaves_legacy_layout_intact(monkeypatch):
+    db.connect_db(":memory:")
+    db._connection.execute(
+        "CREATE TABLE daily_totals (day_local TEXT NOT NULL, user_id TEXT NOT NULL, "
+        "seconds INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (day_local, user_id))"
+    )
+    db._connection.execute("INSERT INTO daily_totals VALUES ('2026-02-01', '7', 42)")
+
+    def failing_backfill(detached):
+        raise RuntimeError("crash mid-migration")
+
+    monkeypatch.setattr(db, "_backfill_legacy_tables", failing_backfill)
+    try:
+        db.initialize_db()
+    except RuntimeError:
+        pass
+
+    assert db._table_columns("daily_totals")["user_id"] == "TEXT"
+    assert db._table_columns("daily_totals_legacy") == {}
+    assert [tuple(row) for row in db._connection.execute("SELECT day_local, user_id, seconds FROM daily_totals")] == [
+        ("2026-02-01", "7", 42)
+    ]
+
+    monkeypatch.undo()
+    db.initialize_db()
+    assert [tuple(row) for row in db.get_daily_totals("2026-02-01")] == [(7, 42)]
+
+    db.close_db()
+
+
+def test_daily_totals_query_uses_index_without_sort():
+    db.connect_db(":memory:")
+    db.initialize_db()
+
+    plan = " ".join(
+        row["detail"]
+        for row in db._connection.execute("EXPLAIN QUERY PLAN " + db._SQL_SELECT_DAILY, ("2026-02-01",))
+    )
+
+    assert "idx_daily_totals_day_seconds" in plan
+    assert "TEMP B-TREE" not in plan
+
+    db.close_db()
+
+
+def test_daily_totals_cache_is_invalidated_by_writes():
+    db.connect_db(":memory:")
+    db.initialize_db()
+
+    db.add_daily_seconds("2026-02-01", 1, 100)
+    assert db.get_daily_totals("2026-02-01") is db.get_daily_totals("2026-02-01")
+
+    db.add_daily_seconds_many([("2026-02-01", 1, 20), ("2026-02-02", 1, 5)])
+
+    assert [row["seconds"] for row in db.get_daily_totals("2026-02-01")] == [120]
+
+    db.close_db()
+
+
+def test_pop_open_session_returns_and_removes_row():
+    db.connect_db(":memory:")
+    db.initialize_db()
+
+    db.set_open_session(7, datetime(2026, 2, 1, 10, 0, tzinfo=timezone.utc))
+
+    session = db.pop_open_session(7)
+    assert session.user_id == 7
+    assert session.started_at_utc == datetime(2026, 2, 1, 10, 0, tzinfo=timezone.utc)
+    assert db.get_open_session(7) is None
+    assert db.pop_open_session(7) is None
+
+    # Epoch seconds are accepted as-is, so callers that already hold one skip the datetime.
+    db.set_open_session(8, 1769940000)
+    assert db.pop_open_session(8).started_at_epoch == 1769940000
+
+    db.close_db()
+
+
+def test_list_open_session_columns_returns_parallel_lists():
+    db.connect_db(":memory:")
+    db.initialize_db()
+
+    assert db.list_open_session_columns() == ([], [])
+
+    db.set_open_session(1, datetime(2026, 2, 1, 10, 0, tzinfo=timezone.utc))
+    db.set_open_session(2, datetime(2026, 2, 1, 11, 0, tzinfo=timezone.utc))
+
+    user_ids, started = db.list_open_session_columns()
+    assert sorted(zip(user_ids, started)) == [
+        (1, int(datetime(2026, 2, 1, 10, 0, tzinfo=timezone.utc).timestamp())),
+        (2, int(datetime(2026, 2, 1, 11, 0, tzinfo=timezone.utc).timestamp())),
+    ]
+
+    db.close_db()
+
+
+def test_open_session_snapshot_is_invalidated_by_writes():
+    db.connect_db(":memory:")
+    db.initialize_db()
+
+    db.set_open_session(1, datetime(2026, 2, 1, 10, 0, tzinfo=timezone.utc))
+    first = db.list_open_session_columns(max_age=60)
+    assert db.list_open_session_columns(max_age=60) is first
+
+    db.set_open_session(2, datetime(2026, 2, 1, 11, 0, tzinfo=timezone.utc))
+    assert sorted(db.list_open_session_columns(max_age=60)[0]) == [1, 2]
+
+    db.pop_open_session(1)
+    assert db.list_open_session_columns(max_age=60)[0] == [2]
+
+    db.close_db()
@@ -1,3 +1,4 @@
+import asyncio
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 
@@ -29,11 +30,11 @@ def test_report_rows_sorted_by_seconds_desc():
     db.connect_db(":memory:")
     db.initialize_db()
 
-    db.add_daily_seconds("2026-02-01", "1", 100)
-    db.add_daily_seconds("2026-02-01", "2", 300)
+    db.add_daily_seconds("2026-02-01", 1, 100)
+    db.add_daily_seconds("2026-02-01", 2, 300)
 
     tz = ZoneInfo("UTC")
-    rows = reporter.build_rows_for_day(FakeGuild(), "2026-02-01", tz, include_live=False)
+    rows = asyncio.run(reporter.fetch_rows_for_day(FakeGuild(), "2026-02-01", tz, include_live=False))
 
     assert [row["display_name"] for row in rows] == ["Bob", "Alice"]
     assert [row["seconds"] for row in rows] == [300, 100]
@@ -45,3 +46,43 @@ def test_no_activity_message():
     content = reporter.build_report_content("2026-02-01", "focus-room", [])
 
     assert "No tracked activity for 2026-02-01." in content
+
+
+def test_fetch_rows_for_day_runs_totals_query_off_loop():
+    db.connect_db(":memory:")
+    db.initialize_db()
+
+    db.add_daily_seconds("2026-02-01", 1, 100)
+
+    tz = ZoneInfo("UTC")
+    rows = asyncio.run(reporter.fetch_rows_for_day(FakeGuild(), "2026-02-01", tz))
+
+    assert rows == [{"user_id": 1, "display_name": "Alice", "seconds": 100}]
+
+    db.close_db()
+
+
+def test_report_content_formats_durations():
+    rows = [
+        {"user_id": 1, "display_name": "Alice", "seconds": 90061},
+        {"user_id": 2, "display_name": "Bob", "seconds": 59},
+    ]
+    content = reporter.build_report_content("2026-02-01", "focus-room", rows)
+
+    assert content.splitlines()[2:] == ["- Alice: `25:01:01`", "- Bob: `00:00:59`"]
+    assert reporter.format_seconds(90061) == "25:01:01"
+
+
+def test_display_names_are_cached_briefly():
+    reporter._display_name_cache.clear()
+    guild = FakeGuild()
+
+    rows = reporter.build_rows_from_totals(guild, {1: 100, 3: 50})
+    assert [row["display_name"] for row in rows] == ["Alice", "User 3"]
+
+    guild.members[1] = FakeMember("Alicia")
+    guild.members[3] = FakeMember("Carol")
+    rows = reporter.build_rows_from_totals(guild, {1: 100, 3: 50})
+    assert [row["display_name"] for row in rows] == ["Alice", "Carol"]
+
+    reporter._display_name_cache.clear()
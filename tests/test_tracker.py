@@ -1,6 +1,8 @@
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 
+import pytest
+
 from src import db
 from src import tracker
 from src.tracker import split_interval_by_local_day
@@ -29,13 +31,13 @@ def test_accumulate_and_end_session_same_day():
     start = datetime(2026, 2, 1, 10, 0, 0, tzinfo=timezone.utc)
     end = datetime(2026, 2, 1, 10, 1, 30, tzinfo=timezone.utc)
 
-    assert tracker.start_session("100", tz, started_at_utc=start) is True
-    tracked = tracker.end_session("100", tz, ended_at_utc=end)
+    assert tracker.start_session(100, tz, started_at_utc=start) is True
+    tracked = tracker.end_session(100, tz, ended_at_utc=end)
 
     assert tracked == 90
 
     totals = tracker.get_totals_for_day("2026-02-01", tz, include_live=False)
-    assert totals == {"100": 90}
+    assert totals == {100: 90}
 
     db.close_db()
 
@@ -46,11 +48,233 @@ def test_include_live_totals_for_today():
     db.initialize_db()
 
     now = datetime(2026, 2, 1, 12, 0, 0, tzinfo=timezone.utc)
-    db.add_daily_seconds("2026-02-01", "200", 120)
-    db.set_open_session("200", datetime(2026, 2, 1, 11, 55, 0, tzinfo=timezone.utc))
+    db.add_daily_seconds("2026-02-01", 200, 120)
+    db.set_open_session(200, datetime(2026, 2, 1, 11, 55, 0, tzinfo=timezone.utc))
 
     totals = tracker.get_totals_for_day("2026-02-01", tz, include_live=True, now_utc=now)
 
-    assert totals["200"] == 420
+    assert totals[200] == 420
+
+    db.close_db()
+
+
+def test_local_time_and_day_uses_local_calendar_day():
+    tz = ZoneInfo("America/New_York")
+    now = datetime(2026, 2, 1, 3, 30, 15, 500000, tzinfo=timezone.utc)
+
+    local, day_local = tracker.local_time_and_day(tz, now)
+
+    assert day_local == "2026-01-31"
+    assert local == datetime(2026, 1, 31, 22, 30, 15, tzinfo=tz)
+    assert tracker.local_day_key(tz, now) == "2026-01-31"
+
+
+def test_rollover_closes_yesterday_and_reopens_at_midnight():
+    tz = ZoneInfo("UTC")
+    db.connect_db(":memory:")
+    db.initialize_db()
+
+    midnight = datetime(2026, 2, 2, 0, 0, 0, tzinfo=timezone.utc)
+    db.set_open_session(1, datetime(2026, 2, 1, 23, 0, 0, tzinfo=timezone.utc))
+    db.set_open_session(2, datetime(2026, 2, 1, 23, 30, 0, tzinfo=timezone.utc))
+    db.set_open_session(3, datetime(2026, 2, 2, 0, 0, 5, tzinfo=timezone.utc))
+
+    tracker.rollover_open_sessions(midnight, tz)
+
+    assert tracker.get_totals_for_day("2026-02-01", tz) == {1: 3600, 2: 1800}
+    assert db.get_open_session(1).started_at_utc == midnight
+    assert db.get_open_session(2).started_at_utc == midnight
+    assert db.get_open_session(3).started_at_utc == datetime(2026, 2, 2, 0, 0, 5, tzinfo=timezone.utc)
+
+    db.close_db()
+
+
+def test_split_interval_handles_dst_length_days():
+    tz = ZoneInfo("America/New_York")
+
+    def split_local(start_local, end_local, zone):
+        return split_interval_by_local_day(
+            start_local.astimezone(timezone.utc), end_local.astimezone(timezone.utc), zone
+        )
+
+    # Spring forward: 2026-03-08 is a 23h day; fall back: 2026-11-01 is a 25h day.
+    assert split_local(datetime(2026, 3, 7, 12, tzinfo=tz), datetime(2026, 3, 9, 12, tzinfo=tz), tz) == [
+        ("2026-03-07", 43200), ("2026-03-08", 82800), ("2026-03-09", 43200),
+    ]
+    assert split_local(datetime(2026, 10, 31, 12, tzinfo=tz), datetime(2026, 11, 2, 12, tzinfo=tz), tz) == [
+        ("2026-10-31", 43200), ("2026-11-01", 90000), ("2026-11-02", 43200),
+    ]
+
+    # Santiago skips 00:00-01:00 on 2024-09-08, so that day starts at the transition.
+    santiago = ZoneInfo("America/Santiago")
+    assert split_local(
+        datetime(2024, 9, 7, 12, tzinfo=santiago), datetime(2024, 9, 8, 12, tzinfo=santiago), santiago
+    ) == [("2024-09-07", 43200), ("2024-09-08", 39600)]
+
+
+def test_live_totals_match_split_buckets_across_dst():
+    tz = ZoneInfo("America/New_York")
+    db.connect_db(":memory:")
+    db.initialize_db()
+
+    start = datetime(2026, 3, 7, 12, tzinfo=tz).astimezone(timezone.utc)
+    now = datetime(2026, 3, 9, 12, tzinfo=tz).astimezone(timezone.utc)
+    db.set_open_session(1, start)
+
+    for day_local, seconds in split_interval_by_local_day(start, now, tz):
+        assert tracker.get_totals_for_day(day_local, tz, include_live=True, now_utc=now) == {1: seconds}
+    assert tracker.get_totals_for_day("2026-03-10", tz, include_live=True, now_utc=now) == {}
+
+    db.close_db()
+
+
+def test_split_interval_fixed_offset_zones():
+    ist = timezone(timedelta(hours=5, minutes=30))
+    start = datetime(2026, 2, 1, 12, tzinfo=ist)
+    end = datetime(2026, 2, 2, 1, tzinfo=ist)
+
+    expected = [("2026-02-01", 43200), ("2026-02-02", 3600)]
+    assert split_interval_by_local_day(start.astimezone(timezone.utc), end.astimezone(timezone.utc), ist) == expected
+
+    utc = ZoneInfo("Etc/UTC")
+    assert split_interval_by_local_day(
+        datetime(2026, 2, 1, 23, tzinfo=timezone.utc), datetime(2026, 2, 2, 0, 30, tzinfo=timezone.utc), utc
+    ) == [("2026-02-01", 3600), ("2026-02-02", 1800)]
+
+
+def test_day_keys_follow_local_midnight():
+    tz = ZoneInfo("America/New_York")
+
+    before = datetime(2026, 3, 8, 4, 59, 59, tzinfo=timezone.utc)
+    after = datetime(2026, 3, 8, 5, 0, tzinfo=timezone.utc)
+    assert tracker.local_day_key(tz, before) == "2026-03-07"
+    assert tracker.local_day_key(tz, after) == "2026-03-08"
+    assert tracker.previous_local_day_key(tz, after) == "2026-03-07"
+    assert tracker.local_day_key(tz, before) == "2026-03-07"
+
+
+def test_split_intervals_matches_single_split():
+    tz = ZoneInfo("America/New_York")
+    end = datetime(2026, 3, 10, tzinfo=tz).astimezone(timezone.utc)
+    starts = [
+        datetime(2026, 3, 7, 12, tzinfo=tz),
+        datetime(2026, 3, 9, 23, tzinfo=tz),
+        datetime(2026, 3, 10, 1, tzinfo=tz),
+    ]
+    start_epochs = [int(start.timestamp()) for start in starts]
+
+    assert tracker.split_intervals_by_local_day(start_epochs, end, tz) == [
+        split_interval_by_local_day(start.astimezone(timezone.utc), end, tz) for start in starts
+    ]
+
+
+def test_split_interval_rejects_naive_datetimes():
+    aware = datetime(2026, 2, 1, 10, tzinfo=timezone.utc)
+    naive = datetime(2026, 2, 1, 11)
+
+    for start, end in ((naive, aware), (aware, naive)):
+        with pytest.raises(ValueError):
+            split_interval_by_local_day(start, end, ZoneInfo("UTC"))
+
+
+def test_rollover_splits_sessions_older_than_yesterday():
+    tz = ZoneInfo("America/New_York")
+    db.connect_db(":memory:")
+    db.initialize_db()
+
+    midnight = tracker.midnight_utc_for_local_day(datetime(2026, 2, 3).date(), tz)
+    db.set_open_session(1, datetime(2026, 2, 1, 22, tzinfo=tz).astimezone(timezone.utc))
+    db.set_open_session(2, datetime(2026, 2, 2, 23, tzinfo=tz).astimezone(timezone.utc))
+
+    tracker.rollover_open_sessions(midnight, tz)
+
+    assert tracker.get_totals_for_day("2026-02-01", tz) == {1: 7200}
+    assert tracker.get_totals_for_day("2026-02-02", tz) == {1: 86400, 2: 3600}
+    assert db.get_open_session(1).started_at_utc == midnight
+    assert db.get_open_session(2).started_at_utc == midnight
+
+    db.close_db()
+
+
+def test_end_session_naive_end_time():
+    tz = ZoneInfo("UTC")
+    db.connect_db(":memory:")
+    db.initialize_db()
+
+    # No open session: ignored as before, whatever the end time looks like.
+    assert tracker.end_session(1, tz, datetime(2026, 2, 1, 11)) == 0
+
+    started = datetime(2026, 2, 1, 10, tzinfo=timezone.utc)
+    db.set_open_session(1, started)
+    with pytest.raises(ValueError):
+        tracker.end_session(1, tz, datetime(2026, 2, 1, 11))
+    assert db.get_open_session(1).started_at_utc == started
+
+    db.close_db()
+
+
+def test_day_key_cache_keeps_current_day_on_historical_lookups():
+    tz = ZoneInfo("Europe/Berlin")
+    now = datetime(2026, 5, 10, 12, tzinfo=timezone.utc)
+    tracker._day_keys_cache.pop(tz, None)
+    assert tracker.local_day_key(tz, now) == "2026-05-10"
+    current = tracker._day_keys_cache[tz]
+
+    assert tracker.local_day_key(tz, now - timedelta(days=3)) == "2026-05-07"
+    assert tracker._day_keys_cache[tz] is current
+
+    assert tracker.local_day_key(tz, now + timedelta(days=1)) == "2026-05-11"
+    assert tracker._day_keys_cache[tz] is not current
+
+
+def test_end_session_same_day_skips_the_split(monkeypatch):
+    tz = ZoneInfo("America/New_York")
+    db.connect_db(":memory:")
+    db.initialize_db()
+
+    def no_split(*args):
+        raise AssertionError("same-day session went through accumulate_interval")
+
+    monkeypatch.setattr(tracker, "accumulate_interval", no_split)
+
+    start = datetime(2026, 2, 1, 23, 0, tzinfo=tz).astimezone(timezone.utc)
+    db.set_open_session(1, start)
+    assert tracker.end_session(1, tz, start + timedelta(minutes=59, seconds=59)) == 3599
+    assert tracker.get_totals_for_day("2026-02-01", tz) == {1: 3599}
+    assert db.get_open_session(1) is None
+
+    db.close_db()
+
+
+def test_end_session_zero_length_records_nothing():
+    tz = ZoneInfo("America/New_York")
+    db.connect_db(":memory:")
+    db.initialize_db()
+
+    start = datetime(2026, 2, 1, 15, 0, tzinfo=timezone.utc)
+    db.set_open_session(1, start)
+    assert tracker.end_session(1, tz, start + timedelta(microseconds=500000)) == 0
+    assert tracker.get_totals_for_day("2026-02-01", tz) == {}
+    assert db.get_open_session(1) is None
+
+    db.close_db()
+
+
+def test_reseed_replaces_open_sessions_with_given_users():
+    db.connect_db(":memory:")
+    db.initialize_db()
+
+    db.set_open_session(1, datetime(2026, 2, 1, 8, tzinfo=timezone.utc))
+    db.set_open_session(2, datetime(2026, 2, 1, 9, tzinfo=timezone.utc))
+
+    started = datetime(2026, 2, 1, 12, tzinfo=timezone.utc)
+    tracker.reseed_sessions([2, 3, 4], started_at_utc=started)
+
+    user_ids, started_at_epochs = db.list_open_session_columns()
+    assert sorted(user_ids) == [2, 3, 4]
+    assert set(started_at_epochs) == {int(started.timestamp())}
+
+    tracker.reseed_sessions([], started_at_utc=started)
+    assert db.list_open_session_columns() == ([], [])
 
     db.close_db()